@@ -1,102 +1,246 @@
+import html
+import json
 import math
-import heapq
-import pandas as pd
-from collections import defaultdict
+import os
+import re
+import string
+from functools import lru_cache
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+from scipy.spatial import cKDTree
 import streamlit as st
 import webbrowser
 import urllib.parse
-import streamlit.components.v1 as components
 
 # --- Graph & Pathfinding Logic ---
 
+# Each location only gets walking edges to its nearest neighbours; longer walks
+# are covered by rail or a chain of short walks
+WALK_NEIGHBORS = 12
+
+# Edge mode codes stored in the graph's uint8 modes array
+MODE_WALK, MODE_NORMAL, MODE_ICE = 0, 1, 2
+MODE_NAMES = ("walk", "normal", "ice")
+# Travel speed in blocks/sec, indexed by mode code
+SPEED_BY_MODE = (3, 8, 72)
+
+def pack(x, z):
+    """Pack integer (x, z) block coordinates into one int64 key"""
+    return (int(x) << 32) | (int(z) & 0xFFFFFFFF)
+
+def unpack(key):
+    """Inverse of pack: returns (x, z)"""
+    return key >> 32, ((key & 0xFFFFFFFF) ^ 0x80000000) - 0x80000000
+
 def euclidean_distance(p1, p2):
     return math.hypot(p1[0] - p2[0], p1[1] - p2[1])
 
-def manhattan_distance(p1, p2):
-    return abs(p1[0] - p2[0]) + abs(p1[1] - p2[1])
+def pairwise_travel_times(coords, speed):
+    """Euclidean travel time between every pair of coords as an (N, N) matrix"""
+    coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+    dx = coords[:, 0, None] - coords[None, :, 0]
+    dz = coords[:, 1, None] - coords[None, :, 1]
+    return np.hypot(dx, dz) / speed
+
+def nearest_neighbor_pairs(coords, k):
+    """Unique (i, j) index pairs, i < j, linking each coord to its k nearest neighbours"""
+    k = min(k, len(coords) - 1)
+    if k < 1:
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp)
+    _, neighbors = cKDTree(coords).query(coords, k=k + 1)
+    rows = np.repeat(np.arange(len(coords)), k + 1)
+    cols = neighbors.ravel()
+    pairs = np.stack([np.minimum(rows, cols), np.maximum(rows, cols)], axis=1)
+    pairs = np.unique(pairs[pairs[:, 0] != pairs[:, 1]], axis=0)
+    return pairs[:, 0], pairs[:, 1]
+
+def _pairwise_edges(rows, cols, times, mode, path_names=None):
+    """Edge arrays (sources, targets, times, modes, path names) linking each rows/cols pair both ways"""
+    if path_names is None:
+        path_names = np.full(len(rows), None, dtype=object)
+    return (
+        np.concatenate([rows, cols]),
+        np.concatenate([cols, rows]),
+        np.concatenate([times, times]),
+        np.full(2 * len(rows), mode, dtype=np.uint8),
+        np.concatenate([path_names, path_names]),
+    )
+
+def _to_csr(num_nodes, edges):
+    """Sort edge arrays by source node into CSR form: (indptr, indices, weights, modes, path names)"""
+    sources, targets, times, modes, path_names = (np.concatenate(column) for column in zip(*edges))
+    order = np.argsort(sources, kind="stable")
+    indptr = np.zeros(num_nodes + 1, dtype=np.int64)
+    np.cumsum(np.bincount(sources, minlength=num_nodes), out=indptr[1:])
+    return (
+        indptr, targets[order].astype(np.int64), times[order].astype(np.float64),
+        modes[order], path_names[order]
+    )
+
+@st.cache_data(show_spinner=False, max_entries=2)
+def _load_excel(filepath, mtime, sheet_name="Tableau Data"):
+    """Parse the workbook once per file version (mtime is only part of the cache key)"""
+    # Imported here so cold starts only pay for pandas when the workbook is actually read
+    import pandas as pd
 
-def build_graph_from_excel(filepath, sheet_name="Tableau Data", include_ice_highways=False):
     df = pd.read_excel(filepath, sheet_name=sheet_name)
-    graph = defaultdict(list)
+
+    # Coordinates are packed into int64 keys, so anything but whole blocks would be truncated
+    coords = df[["X", "Z"]].to_numpy(dtype=np.float64)
+    not_whole = ~(np.isfinite(coords) & (coords == np.round(coords))).all(axis=1)
+    if not_whole.any():
+        bad = ", ".join(map(str, df.loc[not_whole, "Location"].unique()[:5]))
+        raise ValueError(f"X and Z must be whole block coordinates (check: {bad})")
+
     ice_highways = []
     types_lookup = {}
 
     name_to_coord = {}
     owner_lookup = {}
-    # Track path names for map viewing
-    coord_pair_to_path = {}
-
-    # First, collect ALL locations (including those without paths)
-    for _, row in df.iterrows():
-        location = row["Location"]
-        coord = (row["X"], row["Z"])
-        
-        # Only add if we haven't seen this location before
-        if location not in name_to_coord:
-            name_to_coord[location] = coord
-            owner_lookup[location] = row.get("Owner", "")
-            types_lookup[coord] = str(row.get("Type", ""))
-            
-            # Check for ice highways
-            if "Ice Highway" in types_lookup[coord]:
-                ice_highways.append(coord)
-
-    # Then, add rail connections from paths
-    grouped = df.groupby("Path")
-    for path, group in grouped:
-        if len(group) != 2 or pd.isna(path):
-            continue
-
-        p1_row, p2_row = group.iloc[0], group.iloc[1]
-        p1 = (p1_row["X"], p1_row["Z"])
-        p2 = (p2_row["X"], p2_row["Z"])
-        distance = manhattan_distance(p1, p2)
-        travel_time = distance / 8  # 8 units/sec normal
-        graph[p1].append((p2, travel_time, "normal"))
-        graph[p2].append((p1, travel_time, "normal"))
-        
-        # Store the path name for both directions
-        coord_pair_to_path[(p1, p2)] = path
-        coord_pair_to_path[(p2, p1)] = path
-
-    # Add Ice Highway connections
-    if include_ice_highways:
-        for i in range(len(ice_highways)):
-            for j in range(i + 1, len(ice_highways)):
-                p1, p2 = ice_highways[i], ice_highways[j]
-                distance = euclidean_distance(p1, p2)
-                travel_time = distance / 72  # Ice Highway speed
-                graph[p1].append((p2, travel_time, "ice"))
-                graph[p2].append((p1, travel_time, "ice"))
-
-    # Add walking connections between all nodes
-    coords = list(name_to_coord.values())
-    for i in range(len(coords)):
-        for j in range(i + 1, len(coords)):
-            p1, p2 = coords[i], coords[j]
-            distance = euclidean_distance(p1, p2)
-            travel_time = distance / 3  # Walking speed (changed to 3)
-            graph[p1].append((p2, travel_time, "walk"))
-            graph[p2].append((p1, travel_time, "walk"))
-
-    return graph, name_to_coord, owner_lookup, types_lookup, coord_pair_to_path
-
-def dijkstra(graph, start, goal):
-    queue = [(0, start, [])]
-    seen = set()
-
-    while queue:
-        (time_so_far, node, path) = heapq.heappop(queue)
-        if node in seen:
-            continue
-        seen.add(node)
-        path = path + [(node, time_so_far)]
-        if node == goal:
-            return path
-        for (neighbor, weight, mode) in graph.get(node, []):
-            if neighbor not in seen:
-                heapq.heappush(queue, (time_so_far + weight, neighbor, path + [("mode", mode)]))
-    return None
+
+    # First, collect ALL locations (including those without paths), keeping the first row for each
+    locations = df.drop_duplicates("Location", keep="first")
+    for location, x, z, owner, location_type in zip(
+        locations["Location"].to_numpy(),
+        locations["X"].to_numpy(),
+        locations["Z"].to_numpy(),
+        locations["Owner"].to_numpy(),
+        locations["Type"].astype(str).to_numpy(),
+    ):
+        coord = pack(x, z)
+        name_to_coord[location] = coord
+        owner_lookup[location] = owner
+        types_lookup[coord] = location_type
+
+        # Check for ice highways
+        if "Ice Highway" in location_type:
+            ice_highways.append(coord)
+
+    # Pair up the two endpoints of every path; sorting keeps nth(0) and nth(1) aligned
+    rails = df.dropna(subset=["Path"])
+    rails = rails[rails.groupby("Path")["Path"].transform("size") == 2].sort_values("Path", kind="stable")
+    grouped = rails.groupby("Path")
+    first, second = grouped.nth(0), grouped.nth(1)
+
+    return {
+        "rail_paths": first["Path"].to_numpy(),
+        "rail_p1": first[["X", "Z"]].to_numpy(),
+        "rail_p2": second[["X", "Z"]].to_numpy(),
+        "name_to_coord": name_to_coord,
+        "owner_lookup": owner_lookup,
+        "types_lookup": types_lookup,
+        "ice_highways": ice_highways,
+    }
+
+def build_graph(data):
+    """Build the CSR travel graph; nodes are numbered in graph["node_ids"]"""
+    ice_highways = data["ice_highways"]
+    types_lookup = data["types_lookup"]
+
+    name_to_coord = data["name_to_coord"]
+    owner_lookup = data["owner_lookup"]
+
+    # Give each unique (packed) coordinate an int id
+    node_ids = {}
+    for coord in name_to_coord.values():
+        node_ids.setdefault(coord, len(node_ids))
+    edges = []
+
+    # Add rail connections from paths
+    rail_p1, rail_p2 = data["rail_p1"], data["rail_p2"]
+    distances = np.abs(rail_p1[:, 0] - rail_p2[:, 0]) + np.abs(rail_p1[:, 1] - rail_p2[:, 1])
+    rail_times = distances / SPEED_BY_MODE[MODE_NORMAL]
+    rail_rows, rail_cols = [], []
+    for p1, p2 in zip(rail_p1.tolist(), rail_p2.tolist()):
+        rail_rows.append(node_ids.setdefault(pack(*p1), len(node_ids)))
+        rail_cols.append(node_ids.setdefault(pack(*p2), len(node_ids)))
+    # The path name rides along on both directions of its edge for map viewing
+    edges.append(_pairwise_edges(
+        np.array(rail_rows, dtype=np.int64), np.array(rail_cols, dtype=np.int64), rail_times, MODE_NORMAL,
+        data["rail_paths"].astype(object)
+    ))
+
+    nodes = list(node_ids)
+    coords = np.array([unpack(key) for key in nodes], dtype=np.float64).reshape(-1, 2)
+
+    # Add Ice Highway connections (skipped at query time when the toggle is off)
+    ice_ids = np.array([node_ids[coord] for coord in ice_highways], dtype=np.int64)
+    rows, cols = np.triu_indices(len(ice_ids), k=1)
+    ice_times = pairwise_travel_times(coords[ice_ids], SPEED_BY_MODE[MODE_ICE])[rows, cols]
+    edges.append(_pairwise_edges(ice_ids[rows], ice_ids[cols], ice_times, MODE_ICE))
+
+    # Add walking connections between each node and its nearest neighbours
+    rows, cols = nearest_neighbor_pairs(coords, WALK_NEIGHBORS)
+    deltas = coords[rows] - coords[cols]
+    walk_times = np.hypot(deltas[:, 0], deltas[:, 1]) / SPEED_BY_MODE[MODE_WALK]
+    edges.append(_pairwise_edges(rows, cols, walk_times, MODE_WALK))
+
+    indptr, indices, weights, modes, edge_path_name = _to_csr(len(nodes), edges)
+    graph = {
+        "indptr": indptr,
+        "indices": indices,
+        "weights": weights,
+        "modes": modes,
+        "edge_path_name": edge_path_name,
+        "node_ids": node_ids,
+        "nodes": nodes,
+        "coords": coords,
+    }
+    return graph, name_to_coord, owner_lookup, types_lookup
+
+@st.cache_data(show_spinner=False, max_entries=2)
+def _cached_graph(filepath, mtime):
+    """Full graph for one file version; travel modes are filtered per query"""
+    return build_graph(_load_excel(filepath, mtime))
+
+@st.cache_data(show_spinner=False, max_entries=2)
+def _all_pairs_routes(filepath, mtime, include_ice_highways, _graph):
+    """Shortest routes between every pair of nodes for one file version and ice setting.
+
+    _graph is the graph loaded for (filepath, mtime); the leading underscore
+    keeps it out of the cache key. Returns (dist, pred, best_edge) matrices:
+    dist/pred come straight from scipy's all-sources Dijkstra and
+    best_edge[u, v] is the CSR edge used for the hop u -> v.
+    """
+    indptr, indices, weights, modes = _graph["indptr"], _graph["indices"], _graph["weights"], _graph["modes"]
+    num_nodes = len(indptr) - 1
+    sources = np.repeat(np.arange(num_nodes), np.diff(indptr))
+
+    allowed = [MODE_NORMAL, MODE_WALK] + ([MODE_ICE] if include_ice_highways else [])
+    edge_ids = np.flatnonzero(np.isin(modes, allowed))
+    # csr_matrix sums duplicate entries, so keep only the fastest of any parallel edges
+    edge_ids = edge_ids[np.lexsort((weights[edge_ids], indices[edge_ids], sources[edge_ids]))]
+    src, dst = sources[edge_ids], indices[edge_ids]
+    first = np.ones(len(edge_ids), dtype=bool)
+    first[1:] = (src[1:] != src[:-1]) | (dst[1:] != dst[:-1])
+    edge_ids, src, dst = edge_ids[first], src[first], dst[first]
+
+    matrix = csr_matrix((weights[edge_ids], (src, dst)), shape=(num_nodes, num_nodes))
+    dist, pred = dijkstra(matrix, return_predecessors=True)
+    best_edge = np.full((num_nodes, num_nodes), -1, dtype=np.int64)
+    best_edge[src, dst] = edge_ids
+    return dist, pred, best_edge
+
+def route_between(graph, routes, start, goal):
+    """Walk the precomputed predecessors.
+
+    Returns [(node, arrival_time, mode_code, edge), ...] or None, where
+    mode_code/edge describe the CSR edge taken to arrive (None/-1 for the start).
+    """
+    dist, pred, best_edge = routes
+    if start != goal and pred[start, goal] < 0:
+        return None
+
+    path = []
+    node = goal
+    while node != start:
+        prev_node = int(pred[start, node])
+        edge = int(best_edge[prev_node, node])
+        path.append((node, float(dist[start, node]), int(graph["modes"][edge]), edge))
+        node = prev_node
+    path.append((start, 0, None, -1))
+    return path[::-1]
 
 def coordinates_to_names(path, coord_to_name):
     return [coord_to_name.get(coord, str(coord)) for coord in path]
@@ -107,8 +251,38 @@ def format_time(seconds):
     secs = int(seconds % 60)
     return f"{minutes:02d}:{secs:02d}"
 
+@lru_cache(maxsize=4096)
+def extract_location_name(display_name):
+    """Strip the " (Owner)" suffix added to location names in the dropdowns"""
+    if " (" in display_name and display_name.endswith(")"):
+        return display_name.split(" (")[0]
+    return display_name
+
+def owner_suffix(name, owner):
+    """" (Owner)" to show after a location name, or "" when the owner adds nothing"""
+    if owner and owner != "Public Land" and owner.lower() not in name.lower():
+        return f" ({owner})"
+    return ""
+
+def match_location(name, lowered):
+    """Find a location via its {lowercase name: name} map, falling back to a substring match"""
+    key = name.lower()
+    if key in lowered:
+        return lowered[key]
+    for lower_loc, loc in lowered.items():
+        if key in lower_loc or lower_loc in key:
+            return loc
+    return None
+
+# Same escaping as urllib.parse.quote(..., safe=',') for ASCII text
+_URL_SAFE_CHARS = frozenset(string.ascii_letters + string.digits + "_.-~,")
+_URL_QUOTE_TABLE = str.maketrans({
+    chr(code): f"%{code:02X}" for code in range(128) if chr(code) not in _URL_SAFE_CHARS
+})
+
+@lru_cache(maxsize=128)
 def view_on_map(rail_paths):
-    """Generate the map URL with the rail paths - formatted for embedding"""
+    """Generate the map URL with the rail paths (a tuple) - formatted for embedding"""
     if not rail_paths:
         return None
     
@@ -117,16 +291,109 @@ def view_on_map(rail_paths):
     
     # Join paths with commas and encode only special characters (not commas)
     paths_param = ",".join(rail_paths)
-    # Use quote with safe=',' to preserve commas
-    encoded_paths = urllib.parse.quote(paths_param, safe=',')
+    # Escape everything but commas; quote is only needed for non-ASCII (UTF-8) text
+    if paths_param.isascii():
+        encoded_paths = paths_param.translate(_URL_QUOTE_TABLE)
+    else:
+        encoded_paths = urllib.parse.quote(paths_param, safe=',')
     
     # Construct the full URL with embed parameters
     full_url = f"{base_url}Path={encoded_paths}&:embed=yes&:showVizHome=no&:host_url=https%3A%2F%2Fpublic.tableau.com%2F&:embed_code_version=3&:tabs=no&:toolbar=no&:showAppBanner=false&:display_spinner=no"
     
     return full_url
 
+# Native <details> collapsibles styled like st.expander
+_ROUTE_STEPS_CSS = """
+<style>
+details.route-step {
+    border: 1px solid rgba(49, 51, 63, 0.2);
+    border-radius: 0.5rem;
+    padding: 0.5rem 1rem;
+    margin-bottom: 0.5rem;
+}
+details.route-step summary { cursor: pointer; }
+details.route-step p { margin: 0.5rem 0 0; }
+</style>
+"""
+
+def _inline_markdown_to_html(text):
+    """Convert the **bold** and `code` spans used in step text; markdown isn't parsed inside HTML"""
+    text = html.escape(text)
+    text = re.sub(r"\*\*(.+?)\*\*", r"<strong>\1</strong>", text)
+    return re.sub(r"`(.+?)`", r"<code>\1</code>", text)
+
+def render_route_steps(route_steps):
+    """Render every step in a single markdown element instead of one expander per step"""
+    blocks = [
+        f'<details class="route-step"><summary>Step {i}: {_inline_markdown_to_html(step["step"])}</summary>'
+        f'<p><strong>Distance:</strong> {step["distance"]}<br><strong>Time:</strong> ~{step["time"]}</p></details>'
+        for i, step in enumerate(route_steps, 1)
+    ]
+    st.markdown(_ROUTE_STEPS_CSS + "".join(blocks), unsafe_allow_html=True)
+
+# The map iframe's HTML never changes, so Streamlit keeps the same frame across
+# reruns; new URLs arrive via postMessage from a tiny sender frame instead of
+# remounting the Tableau embed
+_MAP_FRAME_HTML = """
+<style>html, body { margin: 0; overflow: hidden; } #viz { display: block; }</style>
+<iframe id="viz" style="width: 100%; height: 700px; border: 0;"></iframe>
+<script>
+const viz = document.getElementById("viz");
+window.addEventListener("message", (event) => {
+    const data = event.data || {};
+    if (data.type === "realms-map-url" && data.url.startsWith("https://public.tableau.com/") && viz.src !== data.url) {
+        viz.src = data.url;
+    }
+});
+// The sender may have posted before this listener existed, so ask it to resend
+for (let i = 0; i < window.parent.frames.length; i++) {
+    window.parent.frames[i].postMessage({type: "realms-map-ready"}, "*");
+}
+</script>
+"""
+
+def _map_url_sender_html(url):
+    """Script-only frame that posts url to the map frame (and re-posts when it asks)"""
+    return f"""
+<script>
+const message = {{type: "realms-map-url", url: {json.dumps(url)}}};
+function send() {{
+    for (let i = 0; i < window.parent.frames.length; i++) {{
+        window.parent.frames[i].postMessage(message, "*");
+    }}
+}}
+window.addEventListener("message", (event) => {{
+    if ((event.data || {{}}).type === "realms-map-ready") send();
+}});
+send();
+</script>
+"""
+
 # --- Streamlit App ---
 
+def _load_session_graph(filepath):
+    """Load the current version of the workbook into the session"""
+    mtime = os.path.getmtime(filepath)
+    graph, name_to_coord, owner_lookup, types_lookup = _cached_graph(filepath, mtime)
+    coord_to_name = {v: k for k, v in name_to_coord.items()}
+    
+    # Format locations with owner info, once per session
+    owner_suffixes = {name: owner_suffix(name, owner_lookup.get(name, "")) for name in name_to_coord}
+    locations = [name + suffix for name, suffix in owner_suffixes.items()]
+    
+    st.session_state.locations = sorted(locations)
+    st.session_state.lowered = {name.lower(): name for name in name_to_coord}
+    st.session_state.filepath = filepath
+    
+    # Keep the graph until the file changes so clicks don't rebuild it
+    st.session_state.mtime = mtime
+    st.session_state.graph = graph
+    st.session_state.name_to_coord = name_to_coord
+    st.session_state.coord_to_name = coord_to_name
+    st.session_state.owner_suffixes = owner_suffixes
+    st.session_state.routes = None
+    st.session_state.routes_include_ice = None
+
 def main():
     st.set_page_config(
         page_title="Shortest Route Finder",
@@ -137,27 +404,15 @@ def main():
     # File path configuration
     filepath = "Realms Map Dataset.xlsx"
     
-    # Initialize session state
-    if 'locations' not in st.session_state:
-        try:
-            graph, name_to_coord, owner_lookup, types_lookup, coord_pair_to_path = build_graph_from_excel(filepath)
-            coord_to_name = {v: k for k, v in name_to_coord.items()}
-            
-            # Format locations with owner info
-            locations = []
-            for name in name_to_coord.keys():
-                owner = owner_lookup.get(name, "")
-                if owner and owner != "Public Land" and owner.lower() not in name.lower():
-                    locations.append(f"{name} ({owner})")
-                else:
-                    locations.append(name)
-            
-            st.session_state.locations = sorted(locations)
-            st.session_state.filepath = filepath
-            
-        except Exception as e:
-            st.error(f"Error loading data: {e}")
-            st.session_state.locations = []
+    # Initialize session state, reloading whenever the workbook changes so the dropdowns,
+    # graph and routes always come from the same version of the file
+    try:
+        if 'locations' not in st.session_state or os.path.getmtime(filepath) != st.session_state.get('mtime'):
+            _load_session_graph(filepath)
+    except Exception as e:
+        st.error(f"Error loading data: {e}")
+        st.session_state.locations = []
+        st.session_state.lowered = {}
     
     # Initialize route results in session state
     if 'route_results' not in st.session_state:
@@ -236,46 +491,37 @@ def main():
                     st.metric("📏 Total Distance", f"{stored['total_distance']:.0f} blocks")
                 
                 st.subheader("📋 Route Steps")
-                for i, step in enumerate(stored['route_steps'], 1):
-                    with st.expander(f"Step {i}: {step['step']}", expanded=False):
-                        st.markdown(f"**Distance:** {step['distance']}")
-                        st.markdown(f"**Time:** ~{step['time']}")
+                render_route_steps(stored['route_steps'])
             
             elif find_path:
                 if origin == destination:
                     st.warning("Origin and destination cannot be the same!")
                 else:
                     # Extract location names (remove owner info if present)
-                    def extract_location_name(display_name):
-                        if " (" in display_name and display_name.endswith(")"):
-                            return display_name.split(" (")[0]
-                        return display_name
-                    
                     origin_name = extract_location_name(origin)
                     dest_name = extract_location_name(destination)
                     
                     try:
-                        # Rebuild graph with current settings
-                        graph, name_to_coord, owner_lookup, types_lookup, coord_pair_to_path = build_graph_from_excel(
-                            filepath, include_ice_highways=include_ice_highways
-                        )
-                        coord_to_name = {v: k for k, v in name_to_coord.items()}
+                        graph = st.session_state.graph
+                        name_to_coord = st.session_state.name_to_coord
+                        coord_to_name = st.session_state.coord_to_name
+                        owner_suffixes = st.session_state.owner_suffixes
                         
                         # More robust location matching
                         if origin_name not in name_to_coord:
                             # Try to find a match in the actual location names
-                            possible_matches = [loc for loc in name_to_coord.keys() if origin_name.lower() in loc.lower() or loc.lower() in origin_name.lower()]
-                            if possible_matches:
-                                origin_name = possible_matches[0]
+                            matched = match_location(origin_name, st.session_state.lowered)
+                            if matched:
+                                origin_name = matched
                             else:
                                 st.error(f"Could not find origin location: '{origin_name}'. Available locations: {list(name_to_coord.keys())[:5]}...")
                                 return
                         
                         if dest_name not in name_to_coord:
                             # Try to find a match in the actual location names
-                            possible_matches = [loc for loc in name_to_coord.keys() if dest_name.lower() in loc.lower() or loc.lower() in dest_name.lower()]
-                            if possible_matches:
-                                dest_name = possible_matches[0]
+                            matched = match_location(dest_name, st.session_state.lowered)
+                            if matched:
+                                dest_name = matched
                             else:
                                 st.error(f"Could not find destination location: '{dest_name}'. Available locations: {list(name_to_coord.keys())[:5]}...")
                                 return
@@ -283,93 +529,89 @@ def main():
                         start = name_to_coord[origin_name]
                         end = name_to_coord[dest_name]
                         
-                        path = dijkstra(graph, start, end)
+                        # Routes only change with the ice highway toggle
+                        if st.session_state.routes_include_ice != include_ice_highways:
+                            st.session_state.routes = _all_pairs_routes(
+                                st.session_state.filepath, st.session_state.mtime, include_ice_highways, graph
+                            )
+                            st.session_state.routes_include_ice = include_ice_highways
+                        routes = st.session_state.routes
+                        node_ids, nodes = graph["node_ids"], graph["nodes"]
+                        path = route_between(graph, routes, node_ids[start], node_ids[end])
+                        if path:
+                            path = [(nodes[node], time, mode, edge) for node, time, mode, edge in path]
+                        
+                        # Walking edges are sparse, so the direct walk may not be in the graph; it is
+                        # always possible, so every origin/destination pair ends up with a route
+                        direct_time = euclidean_distance(unpack(start), unpack(end)) / SPEED_BY_MODE[MODE_WALK]
+                        if not path or direct_time < path[-1][1]:
+                            path = [(start, 0, None, -1), (end, direct_time, MODE_WALK, -1)]
+                            
+                        total_time = 0
+                        total_distance = 0
+                        route_steps = []
+                        rail_paths = []
+                        
+                        # Process each segment
+                        for (coord, time_so_far, _, _), (next_coord, next_time, mode, edge) in zip(path, path[1:]):
+                            segment_time = next_time - time_so_far
+                            distance = segment_time * SPEED_BY_MODE[mode]
+                            total_time = next_time
+                            total_distance += distance
+                            
+                            current_name = coord_to_name.get(coord, str(unpack(coord)))
+                            next_name = coord_to_name.get(next_coord, str(unpack(next_coord)))
+                            next_suffix = owner_suffixes.get(next_name, " (Unknown)")
+                            next_x, next_z = unpack(next_coord)
                             
-                        if not path:
-                                st.error(f"No path found between '{origin_name}' and '{dest_name}'.")
-                                # Clear any previous route results
-                                st.session_state.route_results = None
-                        else:
-                                total_time = 0
-                                total_distance = 0
-                                route_steps = []
-                                rail_paths = []
-                                
-                                # Process each segment
-                                for i in range(0, len(path) - 2, 2):
-                                    if i + 2 >= len(path):
-                                        break
-                                    (coord, _), (_, mode) = path[i], path[i + 1]
-                                    next_coord, next_time = path[i + 2]
-                                    
-                                    segment_time = next_time - path[i][1]
-                                    speed = {"normal": 8, "ice": 72, "walk": 3}.get(mode, 1)
-                                    distance = segment_time * speed
-                                    total_time = next_time
-                                    total_distance += distance
-                                    
-                                    current_name = coord_to_name.get(coord, str(coord))
-                                    next_name = coord_to_name.get(next_coord, str(next_coord))
-                                    next_owner = owner_lookup.get(next_name, "Unknown")
-                                    
-                                    # Store rail paths for map viewing
-                                    if mode == "normal":
-                                        path_name = coord_pair_to_path.get((coord, next_coord))
-                                        if path_name:
-                                            rail_paths.append(path_name)
-                                    
-                                    # Format step description
-                                    if mode == "walk":
-                                        if next_owner and next_owner != "Public Land" and next_owner.lower() not in next_name.lower():
-                                            step_desc = f"🚶 Walk to **{next_name}** ({next_owner}) `({next_coord[0]},{next_coord[1]})`"
-                                        else:
-                                            step_desc = f"🚶 Walk to **{next_name}** `({next_coord[0]},{next_coord[1]})`"
-                                    else:
-                                        mode_icon = {"normal": "🚂", "ice": "🧊"}.get(mode, "🚀")
-                                        mode_name = {"normal": "Rail", "ice": "Ice Highway"}.get(mode, mode.title())
-                                        
-                                        if next_owner and next_owner != "Public Land" and next_owner.lower() not in next_name.lower():
-                                            step_desc = f"{mode_icon} {mode_name} to **{next_name}** ({next_owner})"
-                                        else:
-                                            step_desc = f"{mode_icon} {mode_name} to **{next_name}**"
-                                    
-                                    route_steps.append({
-                                        'step': step_desc,
-                                        'distance': f"{distance:.0f} blocks",
-                                        'time': format_time(segment_time)
-                                    })
-                                
-                                # Store route results in session state to persist across reruns
-                                st.session_state.route_results = {
-                                    'origin_name': origin_name,
-                                    'dest_name': dest_name,
-                                    'total_time': total_time,
-                                    'total_distance': total_distance,
-                                    'route_steps': route_steps,
-                                    'rail_paths': rail_paths,
-                                    'path_found': True
-                                }
-                                
-                                # Automatically generate map URL if there are rail paths
-                                if rail_paths:
-                                    st.session_state.map_url = view_on_map(rail_paths)
-                                
-                                # Display route summary
-                                st.success(f"✅ Route found from **{origin_name}** to **{dest_name}**!")
-                                
-                                # Summary metrics
-                                col_time, col_dist = st.columns(2)
-                                with col_time:
-                                    st.metric("🕐 Total Time", format_time(total_time))
-                                with col_dist:
-                                    st.metric("📏 Total Distance", f"{total_distance:.0f} blocks")
-                                
-                                # Route steps
-                                st.subheader("📋 Route Steps")
-                                for i, step in enumerate(route_steps, 1):
-                                    with st.expander(f"Step {i}: {step['step']}", expanded=False):
-                                        st.markdown(f"**Distance:** {step['distance']}")
-                                        st.markdown(f"**Time:** ~{step['time']}")
+                            # Store rail paths for map viewing
+                            if mode == MODE_NORMAL:
+                                path_name = graph["edge_path_name"][edge]
+                                if path_name:
+                                    rail_paths.append(path_name)
+                            
+                            # Format step description
+                            if mode == MODE_WALK:
+                                step_desc = f"🚶 Walk to **{next_name}**{next_suffix} `({next_x},{next_z})`"
+                            else:
+                                mode_icon = {MODE_NORMAL: "🚂", MODE_ICE: "🧊"}.get(mode, "🚀")
+                                mode_name = {MODE_NORMAL: "Rail", MODE_ICE: "Ice Highway"}.get(mode, MODE_NAMES[mode].title())
+                                step_desc = f"{mode_icon} {mode_name} to **{next_name}**{next_suffix}"
+                            
+                            route_steps.append({
+                                'step': step_desc,
+                                'distance': f"{distance:.0f} blocks",
+                                'time': format_time(segment_time)
+                            })
+                        
+                        # Store route results in session state to persist across reruns
+                        st.session_state.route_results = {
+                            'origin_name': origin_name,
+                            'dest_name': dest_name,
+                            'total_time': total_time,
+                            'total_distance': total_distance,
+                            'route_steps': route_steps,
+                            'rail_paths': rail_paths,
+                            'path_found': True
+                        }
+                        
+                        # Automatically generate map URL if there are rail paths
+                        if rail_paths:
+                            st.session_state.map_url = view_on_map(tuple(rail_paths))
+                        
+                        # Display route summary
+                        st.success(f"✅ Route found from **{origin_name}** to **{dest_name}**!")
+                        
+                        # Summary metrics
+                        col_time, col_dist = st.columns(2)
+                        with col_time:
+                            st.metric("🕐 Total Time", format_time(total_time))
+                        with col_dist:
+                            st.metric("📏 Total Distance", f"{total_distance:.0f} blocks")
+                        
+                        # Route steps
+                        st.subheader("📋 Route Steps")
+                        render_route_steps(route_steps)
                     
                     except Exception as e:
                         st.error(f"Error finding path: {e}")
@@ -390,15 +632,12 @@ def main():
             
             if st.session_state.map_url:
                 # Display the map in an iframe with proper Tableau embedding
-                components.iframe(
-                    st.session_state.map_url,
-                    width=None,  # Use full width of the column
-                    height=700,
-                    scrolling=False
-                )
+                st.iframe(_MAP_FRAME_HTML, height=700)
                 
                 # Fallback link in case iframe doesn't work
                 st.markdown(f"[🔗 Open in full screen]({st.session_state.map_url})")
+                # Last in the column so its 1px slot (the minimum height) doesn't push the link down
+                st.iframe(_map_url_sender_html(st.session_state.map_url), height=1)
                 
             else:
                 # Check if we have route results with rail paths but no map URL yet
@@ -406,7 +645,7 @@ def main():
                     st.session_state.route_results.get('rail_paths') and 
                     not st.session_state.map_url):
                     # Auto-generate map URL for stored route results
-                    st.session_state.map_url = view_on_map(st.session_state.route_results['rail_paths'])
+                    st.session_state.map_url = view_on_map(tuple(st.session_state.route_results['rail_paths']))
                     st.rerun()
                 else:
                     st.info("🗺️ Interactive map will appear here when a route with train connections is found.")